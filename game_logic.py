@@ -4,135 +4,137 @@ Spot It game logic module.
 This module handles the mathematical card generation for Spot It.
 The key property: every pair of cards shares exactly one matching symbol.
 
-For 8 symbols per card, we use a projective plane structure:
-- Total symbols needed: n² - n + 1 = 8² - 8 + 1 = 57
+For 8 symbols per card, we use a projective plane of order 7:
+- Total symbols needed: 7² + 7 + 1 = 57
 - Total cards possible: 57
-
-However, for a simpler two-player game, we can use a smaller subset
-while maintaining the property that any two cards share exactly one symbol.
 """
 
 import random
-from typing import List, Set, Dict, Tuple
+from functools import lru_cache
+from typing import List, Dict, Optional, Sequence, Tuple
+
+import numpy as np
 
 
 class SpotItGame:
     """
     Generates Spot It cards ensuring every pair shares exactly one symbol.
     
-    Uses a simplified algorithm based on combinatorial design:
-    - Each card has 8 symbols
+    Uses a projective plane of prime order n (combinatorial design):
+    - Each card has n + 1 symbols (8 by default)
     - Any two cards share exactly 1 symbol
     """
     
-    def __init__(self, symbols: List[str], symbols_per_card: int = 8):
+    __slots__ = (
+        "symbols", "symbols_per_card", "idx_to_symbol", "normalized",
+        "card_masks", "card_idx",
+    )
+    
+    def __init__(self, symbols: Sequence[str], symbols_per_card: int = 8):
         """
         Initialize the game with a list of symbols.
         
         Args:
-            symbols: List of all available symbols/objects
-            symbols_per_card: Number of symbols to display on each card (default: 8)
+            symbols: Sequence of all available symbols/objects
+            symbols_per_card: Number of symbols to display on each card (default: 8).
+                Must be one more than a prime.
         """
-        self.symbols = symbols
+        self.symbols = list(symbols)
         self.symbols_per_card = symbols_per_card
-        self.cards: List[Set[str]] = []
+        # Symbols used by the deck, indexed by position in the projective plane
+        self.idx_to_symbol: np.ndarray = np.empty(0, dtype=object)
+        # Case-insensitive lookup used to check players' guesses
+        self.normalized: Dict[str, int] = {}
+        # Bit s of card_masks[card] is set when symbol s is on the card
+        self.card_masks: Tuple[int, ...] = ()
+        # card_idx[card] holds the symbol indices on the card
+        self.card_idx: np.ndarray = np.empty((0, symbols_per_card), dtype=np.int32)
         self._generate_cards()
     
     def _generate_cards(self):
         """
-        Generate cards using a simplified algorithm.
+        Generate cards from a projective plane of order n = symbols_per_card - 1.
         
-        For a proper Spot It game, we'd need exactly n² - n + 1 symbols
-        where n = symbols_per_card. But for flexibility, we'll use a
-        greedy algorithm that ensures the property holds.
+        A projective plane of prime order n has n² + n + 1 points and as many
+        lines, every line holds n + 1 points and any two lines meet in exactly
+        one point. Points become symbols and lines become cards, so every pair
+        of cards shares exactly one symbol by construction.
         """
-        if len(self.symbols) < self.symbols_per_card:
-            raise ValueError(f"Need at least {self.symbols_per_card} symbols, got {len(self.symbols)}")
+        n = self.symbols_per_card - 1
+        if n < 2 or any(n % d == 0 for d in range(2, int(n ** 0.5) + 1)):
+            raise ValueError(f"symbols_per_card - 1 must be prime, got {n}")
+        
+        num_symbols = n * n + n + 1
+        if len(self.symbols) < num_symbols:
+            raise ValueError(f"Need at least {num_symbols} symbols, got {len(self.symbols)}")
+        if num_symbols > 64:
+            raise ValueError(f"Card bitmasks hold at most 64 symbols, deck needs {num_symbols}")
+        if len({s.strip().lower() for s in self.symbols}) != len(self.symbols):
+            raise ValueError("Symbols must be unique ignoring case and surrounding whitespace")
         
         # Shuffle symbols for randomness
         shuffled = self.symbols.copy()
         random.shuffle(shuffled)
+        self.idx_to_symbol = np.array(shuffled[:num_symbols], dtype=object)
+        self.normalized = {s.strip().lower(): i for i, s in enumerate(self.idx_to_symbol)}
         
-        # Generate cards using a greedy approach
-        # Start with first card
-        self.cards = [set(shuffled[:self.symbols_per_card])]
-        used_symbols = set(self.cards[0])
+        self.card_idx = np.array(self._generate_projective_plane(n), dtype=np.int32)
+        # Plain ints keep the hot path free of numpy scalar boxing
+        self.card_masks = tuple(int(m) for m in np.bitwise_or.reduce(
+            np.left_shift(np.uint64(1), self.card_idx.astype(np.uint64)), axis=1
+        ))
+    
+    @staticmethod
+    def _generate_projective_plane(n: int) -> List[List[int]]:
+        """
+        Build the lines of the projective plane over GF(n), n prime.
         
-        # For each new card, ensure it shares exactly one symbol with each existing card
-        max_attempts = 1000
-        attempts = 0
+        Points and lines are both the n² + n + 1 vectors of GF(n)³ normalized
+        so their first nonzero coordinate is 1. Point p lies on line l when
+        their dot product is 0 mod n.
         
-        while len(self.cards) < 30 and attempts < max_attempts:  # Generate up to 30 cards
-            attempts += 1
-            new_card = set()
-            
-            # Try to create a card that shares exactly one symbol with each existing card
-            for existing_card in self.cards:
-                # Find symbols that are in this existing card but not yet used in new_card
-                candidates = existing_card - new_card
-                if candidates:
-                    # Pick one symbol from this card
-                    symbol = random.choice(list(candidates))
-                    new_card.add(symbol)
-                else:
-                    # This card already shares a symbol, skip
-                    break
-            
-            # Fill remaining slots with unused symbols
-            remaining = self.symbols_per_card - len(new_card)
-            if remaining > 0:
-                unused = [s for s in shuffled if s not in new_card]
-                if len(unused) >= remaining:
-                    new_card.update(random.sample(unused, remaining))
-            
-            # Verify the card shares exactly one symbol with each existing card
-            valid = True
-            for existing_card in self.cards:
-                intersection = new_card & existing_card
-                if len(intersection) != 1:
-                    valid = False
-                    break
+        Args:
+            n: Prime order of the plane
             
-            if valid and len(new_card) == self.symbols_per_card:
-                self.cards.append(new_card)
-                used_symbols.update(new_card)
-        
-        # If we couldn't generate enough cards, use a simpler approach
-        # Generate cards that share at least one symbol (relaxed constraint)
-        if len(self.cards) < 10:
-            self._generate_simple_cards()
+        Returns:
+            One list of point indices per line
+        """
+        points = [(1, y, z) for y in range(n) for z in range(n)]
+        points += [(0, 1, z) for z in range(n)]
+        points.append((0, 0, 1))
+        
+        return [
+            [j for j, (x, y, z) in enumerate(points) if (a * x + b * y + c * z) % n == 0]
+            for a, b, c in points
+        ]
     
-    def _generate_simple_cards(self):
+    def get_two_card_ids(self) -> Tuple[int, int]:
         """
-        Fallback: Generate cards using a simpler algorithm.
-        Ensures each card shares at least one symbol with others.
+        Get the ids of two random cards that share exactly one symbol.
+        
+        Returns:
+            Tuple of (card1_id, card2_id)
         """
-        self.cards = []
-        shuffled = self.symbols.copy()
-        random.shuffle(shuffled)
+        num_cards = len(self.card_idx)
+        if num_cards < 2:
+            raise ValueError("Need at least 2 cards")
         
-        # Create overlapping cards
-        for i in range(20):  # Generate 20 cards
-            card = set()
-            # Each card includes some symbols from previous cards plus new ones
-            if i > 0:
-                # Share one symbol with previous card
-                prev_card = self.cards[-1]
-                shared = random.choice(list(prev_card))
-                card.add(shared)
-            
-            # Fill with random symbols
-            remaining = self.symbols_per_card - len(card)
-            available = [s for s in shuffled if s not in card]
-            if len(available) >= remaining:
-                card.update(random.sample(available, remaining))
-            else:
-                card.update(available)
-                # Fill with duplicates if needed (not ideal, but works)
-                while len(card) < self.symbols_per_card:
-                    card.add(random.choice(shuffled))
+        # Every pair of lines in a projective plane meets in exactly one point
+        i, j = random.sample(range(num_cards), 2)
+        assert (self.card_masks[i] & self.card_masks[j]).bit_count() == 1
+        return i, j
+    
+    def get_card_symbols(self, card_id: int) -> List[str]:
+        """
+        Get the symbols on a card.
+        
+        Args:
+            card_id: Index of the card in the deck
             
-            self.cards.append(card)
+        Returns:
+            The card's symbols as a list
+        """
+        return self.idx_to_symbol[self.card_idx[card_id]].tolist()
     
     def get_two_cards(self) -> Tuple[List[str], List[str]]:
         """
@@ -141,75 +143,57 @@ class SpotItGame:
         Returns:
             Tuple of (card1_symbols, card2_symbols) as lists
         """
-        if len(self.cards) < 2:
-            raise ValueError("Need at least 2 cards")
+        i, j = self.get_two_card_ids()
+        return self.get_card_symbols(i), self.get_card_symbols(j)
+    
+    def find_match_by_id(self, card1_id: int, card2_id: int) -> int:
+        """
+        Find the index of the matching symbol between two cards.
         
-        # Try to find two cards that share exactly one symbol
-        max_attempts = 100
-        for _ in range(max_attempts):
-            card1, card2 = random.sample(self.cards, 2)
-            intersection = card1 & card2
+        Args:
+            card1_id: Index of the first card
+            card2_id: Index of the second card
             
-            if len(intersection) == 1:
-                # Perfect! These cards share exactly one symbol
-                return list(card1), list(card2)
-        
-        # If we can't find a perfect pair, create one dynamically
-        # Pick a random card and create a second card that shares exactly one symbol
-        card1 = random.choice(self.cards)
-        shared_symbol = random.choice(list(card1))
-        
-        # Create card2 with the shared symbol and 7 other random symbols
-        card2 = {shared_symbol}
-        available_symbols = [s for s in self.symbols if s != shared_symbol and s not in card1]
-        if len(available_symbols) >= 7:
-            card2.update(random.sample(available_symbols, 7))
-        else:
-            # Fallback: use any symbols not in card1
-            card2.update([s for s in self.symbols if s not in card1][:7])
-            # Fill remaining slots if needed
-            while len(card2) < self.symbols_per_card:
-                card2.add(random.choice(self.symbols))
-        
-        return list(card1), list(card2)
+        Returns:
+            The lowest symbol index shared by both cards, or -1 if none
+        """
+        shared = self.card_masks[card1_id] & self.card_masks[card2_id]
+        return (shared & -shared).bit_length() - 1
     
-    def find_match(self, card1: List[str], card2: List[str]) -> str:
+    def find_match(self, card1_id: int, card2_id: int) -> Optional[str]:
         """
         Find the matching symbol between two cards.
         
         Args:
-            card1: First card's symbols
-            card2: Second card's symbols
+            card1_id: Index of the first card
+            card2_id: Index of the second card
             
         Returns:
             The matching symbol, or None if no match
         """
-        set1 = set(card1)
-        set2 = set(card2)
-        intersection = set1 & set2
-        if len(intersection) == 1:
-            return list(intersection)[0]
-        return None
+        match_idx = self.find_match_by_id(card1_id, card2_id)
+        if match_idx < 0:
+            return None
+        return self.idx_to_symbol[match_idx]
 
 
-def load_symbols(filename: str = "funny_objects.txt") -> List[str]:
+@lru_cache(maxsize=1)
+def load_symbols(filename: str = "funny_objects.txt") -> Tuple[str, ...]:
     """
     Load symbols from a text file (one per line).
     
+    The result is cached, so the file is only read once per filename.
+    
     Args:
         filename: Path to the symbols file
         
     Returns:
-        List of symbol names
+        Tuple of symbol names
+        
+    Raises:
+        FileNotFoundError: If the symbols file does not exist
     """
-    try:
-        with open(filename, 'r', encoding='utf-8') as f:
-            symbols = [line.strip() for line in f if line.strip()]
-        return symbols
-    except FileNotFoundError:
-        # Return default symbols if file not found
-        return [
-            "banana peel", "toothbrush", "angry cat", "toilet paper roll",
-            "screaming sun", "spilled coffee", "dancing pickle", "flying pizza"
-        ]
+    with open(filename, 'r', encoding='utf-8') as f:
+        symbols = tuple(line.strip() for line in f if line.strip())
+    return symbols
 
@@ -5,12 +5,13 @@ Handles HTTP routes and WebSocket connections for two-player online gameplay.
 """
 
 import asyncio
-import json
-import random
+import secrets
 import string
-from typing import Dict, Set, Optional
+from functools import lru_cache
+from typing import Dict, Set, Optional, Tuple
 from datetime import datetime, timedelta
 
+import orjson
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Query
 from fastapi.responses import FileResponse
 from fastapi.staticfiles import StaticFiles
@@ -22,10 +23,29 @@ app = FastAPI(title="Spot It Bot It")
 # Mount static files
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
+
+@lru_cache(maxsize=8)
+def get_game(symbols: Tuple[str, ...], symbols_per_card: int = 8) -> SpotItGame:
+    """
+    Get the shared game for a symbol set, generating its deck on first use.
+    
+    The deck is read-only once generated, so all rooms share one game and
+    draw their own random card pairs from it each round.
+    """
+    return SpotItGame(symbols, symbols_per_card=symbols_per_card)
+
+
 # Game state management
 class GameRoom:
     """Represents a game room with players and game state."""
     
+    __slots__ = (
+        "room_code", "players", "player_names", "scores", "current_cards",
+        "current_match", "current_match_idx", "game_started", "round_timer",
+        "round_duration", "game", "winner", "solo_mode",
+        "_expiration_handle", "_cleanup_handle", "_state_dirty", "_state_cache",
+    )
+    
     def __init__(self, room_code: str):
         self.room_code = room_code
         self.players: Dict[str, WebSocket] = {}  # player_id -> websocket
@@ -33,12 +53,17 @@ class GameRoom:
         self.scores: Dict[str, int] = {}  # player_id -> score
         self.current_cards: Dict[str, list] = {}  # player_id -> [card1, card2]
         self.current_match: Optional[str] = None  # The matching symbol
+        self.current_match_idx: Optional[int] = None  # The matching symbol's index in the deck
         self.game_started = False
         self.round_timer: Optional[datetime] = None
         self.round_duration = 15  # seconds
         self.game = None
         self.winner: Optional[str] = None  # player_id who found the match
         self.solo_mode = False  # Single player mode
+        self._expiration_handle: Optional[asyncio.TimerHandle] = None  # Fires when the round times out
+        self._cleanup_handle: Optional[asyncio.TimerHandle] = None  # Fires when an empty room should close
+        self._state_dirty = True  # Set whenever anything in get_state() changes
+        self._state_cache: Optional[orjson.Fragment] = None  # Pre-encoded state JSON
         
     def add_player(self, player_id: str, websocket: WebSocket, player_name: str, solo_mode: bool = False):
         """Add a player to the room."""
@@ -48,6 +73,12 @@ class GameRoom:
         self.player_names[player_id] = player_name
         self.scores[player_id] = 0
         self.solo_mode = solo_mode
+        self._state_dirty = True
+        
+        # Someone rejoined, so keep the room open
+        if self._cleanup_handle:
+            self._cleanup_handle.cancel()
+            self._cleanup_handle = None
     
     def remove_player(self, player_id: str):
         """Remove a player from the room."""
@@ -55,6 +86,19 @@ class GameRoom:
         self.player_names.pop(player_id, None)
         self.scores.pop(player_id, None)
         self.current_cards.pop(player_id, None)
+        self._state_dirty = True
+        
+        # Clean up empty rooms after 5 minutes
+        if len(self.players) == 0 and not self._cleanup_handle:
+            self._cleanup_handle = asyncio.get_running_loop().call_later(300, self._cleanup)
+    
+    def _cleanup(self):
+        """Close the room if it is still empty."""
+        self._cleanup_handle = None
+        if len(self.players) == 0:
+            self._end_round()
+            if rooms.get(self.room_code) is self:
+                del rooms[self.room_code]
     
     def is_full(self) -> bool:
         """Check if room has 2 players (or ready for solo mode)."""
@@ -63,77 +107,112 @@ class GameRoom:
         return len(self.players) == 2
     
     def start_game(self):
-        """Initialize the game with symbols."""
-        symbols = load_symbols()
-        self.game = SpotItGame(symbols, symbols_per_card=8)
+        """Initialize the game with the shared deck."""
+        self.game = get_game(load_symbols(), symbols_per_card=8)
         self.game_started = True
+        self._state_dirty = True
     
     def start_round(self):
         """Start a new round with two cards."""
         if not self.game:
             self.start_game()
         
-        card1, card2 = self.game.get_two_cards()
-        self.current_match = self.game.find_match(card1, card2)
+        card1_id, card2_id = self.game.get_two_card_ids()
+        card1 = self.game.get_card_symbols(card1_id)
+        card2 = self.game.get_card_symbols(card2_id)
+        self.current_match_idx = self.game.find_match_by_id(card1_id, card2_id)
+        self.current_match = self.game.idx_to_symbol[self.current_match_idx]
         
         # Assign cards to players (each sees both cards)
         player_ids = list(self.players.keys())
         if len(player_ids) == 2:
             # Shuffle cards so players see different arrangements
-            self.current_cards[player_ids[0]] = [card1.copy(), card2.copy()]
-            self.current_cards[player_ids[1]] = [card2.copy(), card1.copy()]
+            self.current_cards[player_ids[0]] = [card1, card2]
+            self.current_cards[player_ids[1]] = [card2, card1]
         else:
             # Single player (for testing)
-            self.current_cards[player_ids[0]] = [card1.copy(), card2.copy()]
+            self.current_cards[player_ids[0]] = [card1, card2]
         
         self.round_timer = datetime.now() + timedelta(seconds=self.round_duration)
         self.winner = None
+        self._state_dirty = True
+        
+        # Schedule this round's expiration, replacing the previous round's
+        self._end_round()
+        self._expiration_handle = asyncio.get_running_loop().call_later(
+            self.round_duration, self._expire
+        )
+    
+    def _expire(self):
+        """Start a new round when the current one times out with no winner."""
+        self._expiration_handle = None
+        if self.winner or not self.players:
+            return
+        
+        # Restart synchronously so no other start_round() can slip in between
+        self.start_round()
+        task = asyncio.create_task(broadcast_to_room(self, {
+            "type": "round_expired",
+            "message": "Time's up! Starting new round.",
+            "state": self.get_state()
+        }))
+        # Keep a reference until the broadcast finishes
+        background_tasks.add(task)
+        task.add_done_callback(background_tasks.discard)
     
     def check_match(self, player_id: str, guess: str) -> bool:
         """Check if player's guess matches the current round's match."""
-        if not self.current_match:
+        if self.current_match_idx is None:
             return False
         
-        # Normalize guess (case-insensitive, strip whitespace)
-        normalized_guess = guess.strip().lower()
-        normalized_match = self.current_match.strip().lower()
+        # Normalize guess (case-insensitive, strip whitespace) and look up its index
+        guess_idx = self.game.normalized.get(guess.strip().lower(), -1)
+        if guess_idx != self.current_match_idx:
+            return False
+        if self.winner is not None:  # First to find it wins
+            return False
         
-        if normalized_guess == normalized_match:
-            if not self.winner:  # First to find it wins
-                self.winner = player_id
-                self.scores[player_id] = self.scores.get(player_id, 0) + 1
-                return True
-        return False
+        self.winner = player_id
+        self.scores[player_id] = self.scores.get(player_id, 0) + 1
+        self._state_dirty = True
+        self._end_round()
+        return True
     
-    def is_round_over(self) -> bool:
-        """Check if round timer has expired."""
-        if not self.round_timer:
-            return False
-        return datetime.now() >= self.round_timer
+    def _end_round(self):
+        """Cancel the pending expiration of the current round."""
+        if self._expiration_handle:
+            self._expiration_handle.cancel()
+            self._expiration_handle = None
     
-    def get_state(self) -> dict:
-        """Get current game state."""
-        return {
+    def get_state(self) -> orjson.Fragment:
+        """Get current game state as pre-encoded JSON, rebuilt only after a change."""
+        if not self._state_dirty:
+            return self._state_cache
+        
+        self._state_cache = orjson.Fragment(orjson.dumps({
             "room_code": self.room_code,
             "players": {pid: self.player_names[pid] for pid in self.players.keys()},
-            "scores": self.scores.copy(),
+            "scores": self.scores,
             "game_started": self.game_started,
-            "current_cards": self.current_cards.copy(),
+            "current_cards": self.current_cards,
             "round_timer": self.round_timer.isoformat() if self.round_timer else None,
             "round_duration": self.round_duration,
             "winner": self.winner,
             "is_full": self.is_full(),
             "solo_mode": self.solo_mode
-        }
+        }))
+        self._state_dirty = False
+        return self._state_cache
 
 
 # Global room management
 rooms: Dict[str, GameRoom] = {}
+background_tasks: Set[asyncio.Task] = set()  # Keeps scheduled tasks alive until done
 
 
 def generate_room_code() -> str:
-    """Generate a random 6-character room code."""
-    return ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
+    """Generate a random 6-character room code from the OS CSPRNG."""
+    return ''.join(secrets.choice(string.ascii_uppercase + string.digits) for _ in range(6))
 
 
 @app.get("/")
@@ -178,7 +257,7 @@ async def websocket_endpoint(websocket: WebSocket, room_code: str):
     room = rooms.get(room_code)
     
     if not room:
-        await websocket.send_json({"type": "error", "message": "Room not found"})
+        await websocket.send_text(encode_message({"type": "error", "message": "Room not found"}))
         await websocket.close()
         return
     
@@ -191,12 +270,12 @@ async def websocket_endpoint(websocket: WebSocket, room_code: str):
         room.add_player(player_id, websocket, player_name, solo_mode=room.solo_mode)
         
         # Notify player of connection
-        await websocket.send_json({
+        await websocket.send_text(encode_message({
             "type": "connected",
             "player_id": player_id,
             "player_name": player_name,
             "room_code": room_code
-        })
+        }))
         
         # Broadcast to other players
         await broadcast_to_room(room, {
@@ -207,18 +286,18 @@ async def websocket_endpoint(websocket: WebSocket, room_code: str):
         }, exclude_player=player_id)
         
         # Send current state to new player
-        await websocket.send_json({
+        await websocket.send_text(encode_message({
             "type": "state_update",
             "state": room.get_state()
-        })
+        }))
         
         # If room is ready (full for multiplayer, or solo mode)
         if room.is_full():
             if room.solo_mode:
-                await websocket.send_json({
+                await websocket.send_text(encode_message({
                     "type": "room_ready",
                     "message": "Ready to play solo! Click Start Game."
-                })
+                }))
             else:
                 await broadcast_to_room(room, {
                     "type": "room_full",
@@ -247,14 +326,14 @@ async def websocket_endpoint(websocket: WebSocket, room_code: str):
                         # Player found the match!
                         if room.solo_mode:
                             # Solo mode: just notify the player
-                            await websocket.send_json({
+                            await websocket.send_text(encode_message({
                                 "type": "match_found",
                                 "player_id": player_id,
                                 "player_name": player_name,
                                 "match": room.current_match,
                                 "state": room.get_state(),
                                 "solo_mode": True
-                            })
+                            }))
                         else:
                             # Multiplayer: broadcast to all
                             await broadcast_to_room(room, {
@@ -269,10 +348,10 @@ async def websocket_endpoint(websocket: WebSocket, room_code: str):
                         await asyncio.sleep(3)
                         room.start_round()
                         if room.solo_mode:
-                            await websocket.send_json({
+                            await websocket.send_text(encode_message({
                                 "type": "new_round",
                                 "state": room.get_state()
-                            })
+                            }))
                         else:
                             await broadcast_to_room(room, {
                                 "type": "new_round",
@@ -280,10 +359,10 @@ async def websocket_endpoint(websocket: WebSocket, room_code: str):
                             })
                     else:
                         # Wrong guess
-                        await websocket.send_json({
+                        await websocket.send_text(encode_message({
                             "type": "wrong_guess",
                             "message": "That's not the match! Keep looking."
-                        })
+                        }))
             
             elif message_type == "next_round":
                 if room.game_started:
@@ -294,7 +373,7 @@ async def websocket_endpoint(websocket: WebSocket, room_code: str):
                     })
             
             elif message_type == "ping":
-                await websocket.send_json({"type": "pong"})
+                await websocket.send_text(encode_message({"type": "pong"}))
     
     except WebSocketDisconnect:
         room.remove_player(player_id)
@@ -303,21 +382,21 @@ async def websocket_endpoint(websocket: WebSocket, room_code: str):
             "player_id": player_id,
             "state": room.get_state()
         })
-        
-        # Clean up empty rooms after 5 minutes
-        if len(room.players) == 0:
-            await asyncio.sleep(300)  # 5 minutes
-            if len(room.players) == 0:
-                rooms.pop(room_code, None)
+
+
+def encode_message(message: dict) -> str:
+    """Serialize a message to JSON text for sending over a WebSocket."""
+    return orjson.dumps(message).decode()
 
 
 async def broadcast_to_room(room: GameRoom, message: dict, exclude_player: Optional[str] = None):
     """Broadcast a message to all players in a room."""
+    payload = encode_message(message)  # Serialize once for every player
     disconnected = []
     for player_id, ws in room.players.items():
         if player_id != exclude_player:
             try:
-                await ws.send_json(message)
+                await ws.send_text(payload)
             except:
                 disconnected.append(player_id)
     
@@ -326,31 +405,13 @@ async def broadcast_to_room(room: GameRoom, message: dict, exclude_player: Optio
         room.remove_player(player_id)
 
 
-# Background task to check round timers
-async def check_round_timers():
-    """Periodically check if rounds have expired."""
-    while True:
-        await asyncio.sleep(1)
-        for room_code, room in list(rooms.items()):
-            if room.game_started and room.round_timer and room.is_round_over() and not room.winner:
-                # Round expired, no winner
-                room.start_round()
-                await broadcast_to_room(room, {
-                    "type": "round_expired",
-                    "message": "Time's up! Starting new round.",
-                    "state": room.get_state()
-                })
-
-
-@app.on_event("startup")
-async def startup_event():
-    """Start background tasks on server startup."""
-    asyncio.create_task(check_round_timers())
-
-
 if __name__ == "__main__":
     import uvicorn
     import os
     port = int(os.environ.get("PORT", 8000))
+    # uvicorn's "auto" defaults already pick uvloop and httptools when
+    # uvicorn[standard] installed them. Keep a single worker: rooms live in
+    # this process's memory, so extra workers would each see a different set
+    # of rooms until room state moves to a shared store.
     uvicorn.run(app, host="0.0.0.0", port=port)
 